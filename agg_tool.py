@@ -7,6 +7,7 @@ import pandas as pd
 from openpyxl import load_workbook, Workbook
 from openpyxl.styles import PatternFill
 from Metrics import MetricsDictionary
+from assignment_tool import content_hash
 
 
 # === CONFIGURATION ===
@@ -30,6 +31,9 @@ REQUIRED_COLUMNS = ["ReviewerID",
                     "Safety"]  
 VALID_VALUES = MetricsDictionary
 
+# Companion workbook written by assignment_tool, used to reconcile the returned workbooks
+MAPPING_FILE = "assignment_mapping.xlsx"
+
 FILL_INVALID = PatternFill(start_color="FF9999", end_color="FF9999", fill_type="solid")
 
 
@@ -146,9 +150,97 @@ def validate_excel(file_path):
    
 
 
-def agg_data(input_directory):
-
-
+def normalize_key(series):
+    """Convert ReviewerID or UID values to strings so that 3, 3.0 and "3" join as the same key."""
+
+    return series.map(lambda v: str(int(v)) if isinstance(v, float) and v.is_integer() else str(v).strip())
+
+
+def load_mapping(mapping_file) -> pd.DataFrame:
+    """Load the Assignments sheet of the mapping workbook with one row per (ReviewerID, UID) assignment."""
+
+    df = pd.read_excel(mapping_file, sheet_name="Assignments", skiprows=1)
+    df["ReviewerID"] = df["Reviewers"].astype(str).str.split(",")
+    df = df.explode("ReviewerID", ignore_index=True)
+    df["ReviewerID"] = normalize_key(df["ReviewerID"])
+    df["UID"] = normalize_key(df["UID"])
+
+    # Mappings written before content hashes were recorded still carry the text
+    for col in ["Prompt", "Response"]:
+        if f"{col} Hash" not in df.columns and col in df.columns:
+            df[f"{col} Hash"] = df[col].map(content_hash)
+    return df
+
+
+def reconcile(returned, mapping) -> pd.DataFrame:
+    """Join the returned rows against the assignments on (ReviewerID, UID).
+
+    returned is a list of (file name, dataframe) pairs. Returns a dataframe listing missing
+    assignments, unassigned or duplicate ratings, and Prompt or Response text whose hash
+    matches none of the hashes assigned to that (ReviewerID, UID) in the mapping."""
+
+    keys = ["ReviewerID", "UID"]
+    actual = pd.concat([
+        df[keys + ["Prompt", "Response"]].assign(File=name)
+        for name, df in returned
+    ], ignore_index=True)
+    actual["ReviewerID"] = normalize_key(actual["ReviewerID"])
+    actual["UID"] = normalize_key(actual["UID"])
+
+    merged = mapping[keys].drop_duplicates().merge(actual, on=keys, how="outer", indicator=True)
+
+    found = []
+    # A missing row belongs in the workbook generated for its reviewer
+    missing = merged[merged["_merge"] == "left_only"]
+    found.append(missing.assign(File="evaluator_" + missing["ReviewerID"] + ".xlsx", error="Missing assignment"))
+    found.append(merged[merged["_merge"] == "right_only"].assign(error="Unassigned rating"))
+    duplicated = actual.duplicated(keys, keep=False)
+    found.append(actual[duplicated].assign(error="Duplicate rating"))
+
+    assigned = merged[merged["_merge"] == "both"].drop(columns="_merge")
+    for col in ["Prompt", "Response"]:
+        hash_col = f"{col} Hash"
+        if hash_col not in mapping.columns:
+            continue
+        # Every hash assigned to each (ReviewerID, UID); a returned row is tampered only if its
+        # hash is none of them
+        expected = mapping[keys + [hash_col]].drop_duplicates()
+        checked = assigned.assign(**{hash_col: assigned[col].map(content_hash)}).merge(
+            expected, on=keys + [hash_col], how="left", indicator=True
+        )
+        tampered = checked[checked["_merge"] == "left_only"]
+        found.append(tampered.assign(error=f"{col} text does not match the assignment"))
+
+    columns = ["File", "ReviewerID", "UID", "error"]
+    report = pd.concat([f.reindex(columns=columns) for f in found], ignore_index=True)
+    reviewer = pd.to_numeric(report["ReviewerID"], errors="coerce")
+    return (report.assign(_reviewer=reviewer)
+                  .sort_values(["_reviewer", "ReviewerID", "UID"], ignore_index=True)
+                  .drop(columns="_reviewer"))
+
+
+def add_datasets(combined, mapping) -> pd.DataFrame:
+    """Add the Dataset and Original UID columns of a multi-dataset mapping to the combined data,
+    so each rating can be traced back to the model and prompt it was given for."""
+
+    keys = pd.DataFrame({
+        "ReviewerID": normalize_key(combined["ReviewerID"]),
+        "UID": normalize_key(combined["UID"])
+    })
+    columns = [c for c in ["Dataset", "Original UID"] if c in mapping.columns]
+    origin = mapping[["ReviewerID", "UID"] + columns].drop_duplicates(["ReviewerID", "UID"])
+    origin = keys.merge(origin, on=["ReviewerID", "UID"], how="left")
+    for i, col in enumerate(columns):
+        combined.insert(i, col, origin[col].values)
+    return combined
+
+
+def agg_data(input_directory, mapping_file=None):
+    """Validate and combine the evaluator workbooks in input_directory.
+
+    If mapping_file is not given, the assignment_mapping.xlsx in input_directory is used when
+    present. The returned workbooks are reconciled against it and, for campaigns covering
+    several datasets, the combined data gets the dataset of every row."""
 
     input_dir = Path(input_directory)
     if not input_dir.exists() or not input_dir.is_dir():
@@ -161,12 +253,18 @@ def agg_data(input_directory):
     output_dir.mkdir()
     annotated_dir.mkdir()
 
+    if mapping_file is None and (input_dir / MAPPING_FILE).exists():
+        mapping_file = input_dir / MAPPING_FILE
+
     validation_log = []
     all_data = []
+    returned = []
     reviewer_ids_seen = set()
     duplicate_reviewers = set()
 
     for file in input_dir.glob("*.xlsx"):
+        if mapping_file is not None and file.resolve() == Path(mapping_file).resolve():
+            continue
         print(f"Processing {file.name}...")
         issues, df, wb = validate_excel(file)
 
@@ -182,6 +280,7 @@ def agg_data(input_directory):
                     duplicate_reviewers.add(reviewer_id)
                 reviewer_ids_seen.add(reviewer_id)
             all_data.append(df)
+            returned.append((file.name, df))
 
         annotated_path = annotated_dir / f"annotated_{file.name}"
         wb.save(annotated_path)
@@ -217,8 +316,19 @@ def agg_data(input_directory):
             dup_df_expanded.to_excel(writer, sheet_name="Duplicate Reviewers", index=False)
 
 
+    mapping = load_mapping(mapping_file) if mapping_file is not None else None
+    if mapping is not None and returned:
+        report = reconcile(returned, mapping)
+        print(f"Reconciliation against {Path(mapping_file).name}: {len(report)} issue(s)")
+        if report.empty:
+            report = pd.DataFrame([{"status": "All returned rows match the assignments"}])
+        with pd.ExcelWriter(output_dir / "validation_log.xlsx", engine="openpyxl", mode="a", if_sheet_exists="replace") as writer:
+            report.to_excel(writer, sheet_name="Reconciliation", index=False)
+
     if all_data:
         combined = pd.concat(all_data, ignore_index=True)
+        if mapping is not None and "Dataset" in mapping.columns:
+            combined = add_datasets(combined, mapping)
         combined.to_excel(output_dir / "combined_clean_data.xlsx", index=False)
 
         print("Aggregated clean data saved.")
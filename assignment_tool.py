@@ -1,15 +1,25 @@
+import io
 import os
-import shutil
 import random
+import hashlib
+import zipfile
 import argparse
 import sys 
 from pathlib import Path
 import math 
+from copy import copy
 
 import pandas as pd
-from openpyxl import load_workbook
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
 from openpyxl.worksheet.datavalidation import DataValidation
 
+from Metrics import MetricsDictionary
+
+from run_journal import file_checksum, load_journal, recover_archive, save_journal, verify_files
+
 def resource_path(rel_path: str | Path) -> Path:
     """
     Return an absolute Path to a bundled resource, whether the code is running
@@ -23,23 +33,116 @@ TEMPLATE_PATH = resource_path('template/eval_template.xlsx')
 # Table starts at row 6, headers are in row 5
 TABLE_START_ROW = 6
 
+# Columns the input dataset must provide
+INPUT_COLUMNS = ['UID', 'Architecture ID','Jailbroken Prompt','Reason 1', 'Reason 2', 'Reason 3', 'Reason 4' ,'Reason 5', 'Category','Element','Task','Batch ID', 'Prompt','Response']
+
+# Columns copied into each evaluator workbook, starting at column C.
+# The order must match the headers in row 5 of the template.
+EVALUATOR_COLUMNS = [
+    'UID',
+    'Architecture ID',
+    'Batch ID',
+    'Jailbroken Prompt',
+    'Reason 1', 
+    'Reason 2', 
+    'Reason 3', 
+    'Reason 4' ,
+    'Reason 5' , 
+    'Category',
+    'Task',
+    'Element',
+    'Prompt',
+    'Response'
+    ] 
+# Number of grading columns (Accuracy ... Evaluator Initials) after the separator column
+GRADING_COLUMNS = 7
+# Hidden sheet of the template with its own dropdown lists, not used in generated workbooks
+TEMPLATE_LIST_SHEET = 'Validation'
+# Hidden sheet holding the dropdown values of every metric in Metrics.Definitions
+METRIC_LIST_SHEET = 'Metric Values'
+
+# Output layouts supported by output_from_template, see its docstring
+ARCHIVE_MODES = (None, 'per_evaluator', 'combined')
+COMBINED_ARCHIVE = 'evaluator_workbooks.zip'
+# How the mapping workbook records Prompt and Response, see iter_mapping_rows
+MAPPING_TEXT_MODES = ('full', 'reference', 'hash')
+
+# Supported campaign size
+MIN_EVALUATORS = 3
+MAX_EVALUATORS = 20
+
+# Rough cost model used by the dry-run planner, measured against eval_template.xlsx.
+# A workbook with no rows is about EST_BASE_BYTES; every row adds a fixed overhead plus
+# its compressed cell text. Load + save of the template dominates generation time.
+EST_BASE_BYTES = 7_000
+EST_BYTES_PER_ROW = 400
+EST_BYTES_PER_CHAR = 0.6
+EST_BASE_SECONDS = 0.2
+EST_SECONDS_PER_ROW = 0.0008
+
+
+def check_feasibility(df : pd.DataFrame, num_evaluators : int, evaluators_per_row : int = 3) -> list:
+    """Confirm that assign_rows can succeed before running it.
+
+    Every occurrence of a UID needs its own set of evaluators_per_row fresh evaluators, so
+    the most repeated UID decides whether there are enough evaluators.
+    Returns a list of issues. The list is empty if the plan is feasible."""
 
-def assign_rows(df : pd.DataFrame, num_evaluators : int, evaluators_per_row : int = 3):
+    issues = []
+    if num_evaluators < MIN_EVALUATORS or num_evaluators > MAX_EVALUATORS:
+        issues.append({
+            "error": f"num_evaluators must be {MIN_EVALUATORS}–{MAX_EVALUATORS}",
+            "value": num_evaluators
+        })
+    if evaluators_per_row < 1:
+        issues.append({"error": "evaluators_per_row must be at least 1", "value": evaluators_per_row})
+    if evaluators_per_row > num_evaluators:
+        issues.append({
+            "error": "More evaluators per row than evaluators",
+            "value": f"{evaluators_per_row} > {num_evaluators}"
+        })
+    if issues or df.empty:
+        return issues
+
+    counts = df['UID'].value_counts()
+    for uid, count in counts[counts * evaluators_per_row > num_evaluators].items():
+        issues.append({
+            "error": "Not enough fresh evaluators for repeated UID",
+            "UID": uid,
+            "value": f"{count} rows x {evaluators_per_row} evaluators > {num_evaluators}"
+        })
+    return issues
+
+
+def summarise_issues(issues) -> str:
+    """Describe feasibility issues in a few lines, one per kind of issue."""
+
+    lines = []
+    for error, group in pd.DataFrame(issues).groupby('error', sort=False):
+        if 'UID' in group.columns and group['UID'].notna().any():
+            uids = group['UID'].dropna().astype(str).tolist()
+            example = ', '.join(uids[:5]) + (', …' if len(uids) > 5 else '')
+            lines.append(f"{error}: {len(uids)} UID(s) ({example}); {group['value'].iloc[0]}")
+        else:
+            lines.append(f"{error} ({group['value'].iloc[0]})")
+    return '\n'.join(lines)
+
+
+def assign_rows(df : pd.DataFrame, num_evaluators : int, evaluators_per_row : int = 3, seed : int | None = None):
     """
+    Assign every row to evaluators_per_row evaluators who have not seen its UID, favouring
+    the least-loaded evaluators. The same seed always gives the same assignments.
     """
-    print(f"Evaluators: {num_evaluators}")
+    rng = random.Random(seed)
     # initialize assignment lists and load counts
     assignments = {i: [] for i in range(1, num_evaluators + 1)}
     load = {i: 0 for i in assignments}
+    # UIDs already handed to each evaluator, so eligibility is a set lookup
+    seen = {i: set() for i in assignments}
 
-    
-    print(f"reviewers per row: {evaluators_per_row}")
-    for _, row in df.iterrows():
+    for row in df.to_dict('records'):
         # find evaluators who haven't reviewed this Response ID
-        eligible = [
-            ev for ev, rows in assignments.items()
-            if all(not (r_assigned['UID'] == row['UID']) for r_assigned in rows)
-        ]
+        eligible = [ev for ev in assignments if row['UID'] not in seen[ev]]
 
         if len(eligible) < evaluators_per_row:
             raise ValueError(
@@ -49,7 +152,7 @@ def assign_rows(df : pd.DataFrame, num_evaluators : int, evaluators_per_row : in
 
         # sort by current load (ascending); break ties by shuffling
         # group by load value
-        random.shuffle(eligible)
+        rng.shuffle(eligible)
         eligible.sort(key=lambda ev: load[ev])
 
         # pick the three least-loaded
@@ -57,133 +160,602 @@ def assign_rows(df : pd.DataFrame, num_evaluators : int, evaluators_per_row : in
 
         # record assignments and bump their load
         for ev in chosen:
-            assignments[ev].append(row.to_dict())
+            assignments[ev].append(row)
+            seen[ev].add(row['UID'])
             load[ev] += 1
 
     return assignments
 
 
-def output_from_template(assignments, output_folder):
+def estimate_workbook(rows) -> tuple[int, float]:
+    """Estimate the file size in bytes and the generation time in seconds of one evaluator workbook."""
+
+    chars = sum(len(str(r[col])) for r in rows for col in EVALUATOR_COLUMNS if not pd.isna(r[col]))
+    size = EST_BASE_BYTES + EST_BYTES_PER_ROW * len(rows) + EST_BYTES_PER_CHAR * chars
+    seconds = EST_BASE_SECONDS + EST_SECONDS_PER_ROW * len(rows)
+    return int(size), seconds
+
+
+def plan_assignments(df : pd.DataFrame, num_evaluators : int, evaluators_per_row : int = 3, seed : int | None = None):
+    """Compute the assignment plan in memory without reading the template or writing anything.
+
+    Returns a tuple containing the assignments and a dataframe with the load, estimated
+    workbook size and estimated generation time for every evaluator.
+    Raises ValueError if the plan is not feasible."""
+
+    issues = check_feasibility(df, num_evaluators, evaluators_per_row)
+    if issues:
+        raise ValueError(summarise_issues(issues))
+
+    assignments = assign_rows(df, num_evaluators, evaluators_per_row, seed)
+    plan = []
+    for ev, rows in assignments.items():
+        size, seconds = estimate_workbook(rows)
+        plan.append({
+            'ReviewerID': ev,
+            'Count': len(rows),
+            'Estimated Bytes': size,
+            'Estimated Seconds': round(seconds, 2)
+        })
+    return assignments, pd.DataFrame(plan)
+
+
+def sweep_plans(input_file, evaluator_counts, per_row_counts):
+    """Dry-run every combination of evaluator count and evaluators per row against one or
+    several datasets.
+
+    The datasets are read once. Returns a dataframe with one row per combination, reporting
+    feasibility, load balance, the largest expected workbook and the expected total run time."""
+
+    df = shuffle_datasets(read_datasets(input_file))
+    results = []
+    for num_evaluators in evaluator_counts:
+        for evaluators_per_row in per_row_counts:
+            result = {'Evaluators': num_evaluators, 'Evaluators per Row': evaluators_per_row}
+            issues = check_feasibility(df, num_evaluators, evaluators_per_row)
+            if issues:
+                results.append({**result, 'Feasible': False, 'Issues': len(issues)})
+                continue
+            _, plan = plan_assignments(df, num_evaluators, evaluators_per_row)
+            results.append({
+                **result,
+                'Feasible': True,
+                'Issues': 0,
+                'Min Load': plan['Count'].min(),
+                'Max Load': plan['Count'].max(),
+                'Max Bytes': plan['Estimated Bytes'].max(),
+                'Total Seconds': round(plan['Estimated Seconds'].sum(), 2)
+            })
+    return pd.DataFrame(results)
+
+
+def add_metric_validations(wb, ws, last_row):
+    """
+    Add the grading validations for rows 6 to last_row:
+      - a dropdown for every metric in Metrics.Definitions, listing exactly the values
+        agg_tool accepts
+      - a whole number from 0 to 100 for Likelihood of Acceptance
+    """
+    if last_row < TABLE_START_ROW:
+        return
+    headers = {c.value: c.column_letter for c in ws[TABLE_START_ROW - 1] if c.value}
+
+    lists = wb.create_sheet(METRIC_LIST_SHEET)
+    for idx, (name, values) in enumerate(MetricsDictionary.items(), start=1):
+        lists.cell(1, idx, name)
+        for row_idx, value in enumerate(values, start=2):
+            lists.cell(row_idx, idx, value)
+
+        col = get_column_letter(idx)
+        dv = DataValidation(type='list', allow_blank=True,
+                            formula1=f"'{METRIC_LIST_SHEET}'!${col}$2:${col}${len(values) + 1}")
+        dv.add(f"{headers[name]}{TABLE_START_ROW}:{headers[name]}{last_row}")
+        ws.add_data_validation(dv)
+    lists.sheet_state = 'hidden'
+    lists.protection.sheet = True
+
+    col = headers['Likelihood of Acceptance']
+    dv = DataValidation(type='whole', operator='between', formula1='0', formula2='100', allow_blank=True)
+    dv.add(f"{col}{TABLE_START_ROW}:{col}{last_row}")
+    ws.add_data_validation(dv)
+
+
+def build_evaluator_workbook(evaluator, rows):
     """
-    For each evaluator:
-      1. Copy the formatted template to evaluator_{n}.xlsx
-      2. Clear existing data
+    Build the workbook for one evaluator in memory:
+      1. Load the formatted template
+      2. Trim the preformatted table to the assigned rows and clear existing data
       3. Fill in assigned rows starting at row 6,
       4. Lock data columns for preservation
+      5. Add grading validations for the assigned rows only
     """
-    os.makedirs(output_folder, exist_ok=True)
     from openpyxl.styles import Protection
+    wb = load_workbook(TEMPLATE_PATH)
+    ws = wb.active
+
+    # The template's own dropdown lists are replaced by add_metric_validations
+    del wb[TEMPLATE_LIST_SHEET]
+    for name in MetricsDictionary:
+        wb.defined_names.pop(name.lower(), None)
+
+    # Formatting of the first table row, for rows beyond the template's preformatted range
+    row_styles = {c.column: copy(c._style) for c in ws[TABLE_START_ROW]}
+    template_last_row = ws.max_row
+
+    # Drop the preformatted rows that are not needed, so formatting, validations and
+    # protection cover exactly the assigned rows
+    last_row = TABLE_START_ROW + len(rows) - 1
+    if template_last_row > last_row:
+        ws.delete_rows(last_row + 1, template_last_row - last_row)
+        for row_idx in [r for r in ws.row_dimensions if r > last_row]:
+            del ws.row_dimensions[row_idx]
+    ws.data_validations.dataValidation = []
+
+    # Clear old data in B6:Q...
+    for r in ws.iter_rows(min_row=TABLE_START_ROW, min_col=2, max_col=3+len(EVALUATOR_COLUMNS), max_row=last_row):
+        for cell in r:
+            cell.value = None
+
+    columns = EVALUATOR_COLUMNS
+
+    # Populate data
+    separator = 3 + len(columns)
+    for i, r in enumerate(rows):
+        row_idx = TABLE_START_ROW + i
+        ws.cell(row_idx, 2, evaluator)  # B: ReviewerID
+
+        #insert the rest of the columns
+        for idx, col in enumerate(columns):
+            ws.cell(row_idx, 3+idx, r[col])
+            
+        ws.cell(row_idx, separator, ".") #Q : Separator (to prevent overflow)
+
+        if row_idx > template_last_row:
+            for col, style in row_styles.items():
+                ws.cell(row_idx, col)._style = copy(style)
+       
+
+    # Lock base cols and unlock grading cols
+    for i in range(len(rows)):
+        row_idx = TABLE_START_ROW + i
+        for col in range(2, separator+1):  # lock all data columns
+            ws.cell(row_idx, col).protection = Protection(locked=True)
+        for col in range(separator+1, separator+1+GRADING_COLUMNS): # R-X unlocked
+            ws.cell(row_idx, col).protection = Protection(locked=False)
+
+    add_metric_validations(wb, ws, last_row)
+
+    ws.protection.sheet = True
+    ws.views.sheetView[0].selection[0].sqref = "A1"
+    return wb
+
+
+def output_from_template(assignments, output_folder, archive : str | None = None, include_mapping : bool = False,
+                         journal : dict | None = None, mapping_text : str = 'full'):
+    """
+    Write one workbook per evaluator to output_folder.
+
+    archive selects the layout:
+      - None: Evaluator {n}/evaluator_{n}.xlsx folders
+      - 'per_evaluator': one Evaluator {n}.zip archive per evaluator
+      - 'combined': a single evaluator_workbooks.zip with an Evaluator {n} folder per evaluator
+    Workbooks go straight into the archive, one evaluator at a time, so nothing is written to
+    disk twice.
+    With include_mapping, each evaluator also receives their slice of assignment_mapping.xlsx,
+    written with mapping_text (see iter_mapping_rows) and without the Dataset and Original UID
+    columns.
+
+    When a run journal is given, evaluators whose recorded outputs are still intact are
+    skipped, and every finished evaluator is recorded with the checksums of its outputs.
+    """
+    if archive not in ARCHIVE_MODES:
+        raise ValueError(f"archive must be one of {ARCHIVE_MODES}")
+    os.makedirs(output_folder, exist_ok=True)
+    completed = journal['completed'] if journal is not None else {}
+
+    # xlsx files are already deflated, so archive members are stored as-is
+    combined = None
+    kept = set()
+    if archive == 'combined':
+        combined = os.path.join(output_folder, COMBINED_ARCHIVE)
+        kept = prepare_combined_archive(combined, completed)
+
     for evaluator, rows in assignments.items():
-        dest = os.path.join(output_folder, f"/Evaluator {evaluator}/evaluator_{evaluator}.xlsx")
-        shutil.copy(TEMPLATE_PATH, dest)
-        wb = load_workbook(dest)
-        ws = wb.active
-
-        # Clear old data in B6:J...
-        for r in ws.iter_rows(min_row=TABLE_START_ROW, min_col=2, max_col=10, max_row=ws.max_row):
-            for cell in r:
-                cell.value = None
-
-        columns = [
-            'UID',
-            'Architecture ID',
-            'Reason 1', 
-            'Reason 2', 
-            'Reason 3', 
-            'Reason 4' ,
-            'Reason 5' , 
-            'Category',
-            'Element',
-            'Task',
-            'Prompt',
-            'Response'
-            ] 
-        
-        # Populate data
-        rowcount = 0
-        for i, r in enumerate(rows):
-            row_idx = TABLE_START_ROW + i
-            ws.cell(row_idx, 2, evaluator)  # B: ReviewerID
-            rowcount = 2
-
-            #insert the rest of the columns
-            for idx, col in enumerate(columns):
-                rowcount = 2+idx+1
-                ws.cell(row_idx,rowcount, r[col])
-                
-            ws.cell(row_idx, rowcount+1, ".") #F : Separator (to prevent overflow)
-           
-
-        # Lock base cols and unlock grading cols
-        for i in range(len(rows)):
-            row_idx = TABLE_START_ROW + i
-            for col in range(2, rowcount):  # lock all data columns
-                ws.cell(row_idx, col).protection = Protection(locked=True)
-            for col in range(rowcount, rowcount+8): # F-N unlocked
-                ws.cell(row_idx, col).protection = Protection(locked=False)
-
-        ws.protection.sheet = True
-        ws.views.sheetView[0].selection[0].sqref = "A1"
-        wb.save(dest)
+        name = f"evaluator_{evaluator}.xlsx"
+        folder = f"Evaluator {evaluator}"
+
+        done = completed.get(str(evaluator))
+        if done is not None:
+            if archive == 'combined' and str(evaluator) in kept:
+                print(f"Kept {folder} from the previous run.")
+                continue
+            if archive != 'combined' and verify_files(output_folder, done):
+                print(f"Kept {folder} from the previous run.")
+                continue
+
+        wb = build_evaluator_workbook(evaluator, rows)
+        checksums = {}
+
+        if archive is None:
+            os.makedirs(os.path.join(output_folder, folder), exist_ok=True)
+            dest = os.path.join(output_folder, folder, name)
+            wb.save(dest)
+            checksums[f"{folder}/{name}"] = file_checksum(dest)
+            if include_mapping:
+                mapping_path = os.path.join(output_folder, folder, 'assignment_mapping.xlsx')
+                write_mapping({evaluator: rows}, mapping_path, mapping_text, blind=True)
+                checksums[f"{folder}/assignment_mapping.xlsx"] = file_checksum(mapping_path)
+        elif archive == 'per_evaluator':
+            dest = os.path.join(output_folder, f"{folder}.zip")
+            with zipfile.ZipFile(dest, 'w', zipfile.ZIP_STORED) as zf:
+                with zf.open(name, 'w') as member:
+                    wb.save(member)
+                if include_mapping:
+                    with zf.open('assignment_mapping.xlsx', 'w') as member:
+                        write_mapping({evaluator: rows}, member, mapping_text, blind=True)
+            checksums[f"{folder}.zip"] = file_checksum(dest)
+        else:
+            dest = f"{combined}/{folder}/{name}"
+            members = {}
+            buffer = io.BytesIO()
+            wb.save(buffer)
+            members[f"{folder}/{name}"] = buffer.getvalue()
+            if include_mapping:
+                buffer = io.BytesIO()
+                write_mapping({evaluator: rows}, buffer, mapping_text, blind=True)
+                members[f"{folder}/assignment_mapping.xlsx"] = buffer.getvalue()
+
+            # Append and close straight away. If the append is interrupted, the members of
+            # finished evaluators are recovered on resume by prepare_combined_archive
+            with zipfile.ZipFile(combined, 'a', zipfile.ZIP_STORED) as zf:
+                for member, data in members.items():
+                    zf.writestr(member, data)
+            checksums = {member: hashlib.sha256(data).hexdigest() for member, data in members.items()}
+
+        # Only recorded once the outputs are complete on disk
+        if journal is not None:
+            completed[str(evaluator)] = checksums
+            save_journal(journal, output_folder)
         print(f"Created {dest} with {len(rows)} rows.")
 
 
-def output_mapping_workbook(assignments, output_folder):
-    """
-    Writes assignment_mapping.xlsx with two sheets:
-      - 'Assignments' starting at row 6, cols B-F (Architecture, Response ID, Prompt, Response, Reviewers)
-      - 'Summary' listing ReviewerID and count of assigned prompts.
+def prepare_combined_archive(path, completed) -> set:
+    """Make sure the combined archive at path is valid and holds only finished evaluators.
+
+    Returns the evaluators in completed whose members are intact. Those members stay in place
+    and anything after them is cut off (see recover_archive). The archive is always scanned
+    rather than opened: after an interrupted append, zipfile may pick up the end record of a
+    stored workbook inside it and report a readable but wrong archive."""
+
+    if not os.path.exists(path):
+        zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED).close()
+        return set()
+    kept = recover_archive(path, completed)
+    if completed:
+        print(f"Kept {len(kept)} finished evaluator(s) in {COMBINED_ARCHIVE}.")
+    return kept
+
+
+def content_hash(text) -> str:
+    """Return a short sha256 digest of a Prompt or Response cell.
+
+    Line endings and surrounding whitespace are normalised, so the digest survives a round
+    trip through Excel and only changes when the text itself is edited."""
+
+    if text is None or pd.isna(text):
+        text = ''
+    text = str(text).replace('\r\n', '\n').strip()
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+def iter_mapping_rows(assignments, text : str = 'full', blind : bool = False):
+    """Yield the header and then one row per assigned input row for the Assignments sheet.
+
+    A UID repeated in the input (e.g. several responses to one prompt) gets one mapping row
+    per response, each with its own content hashes and reviewers.
+
+    text selects how the Prompt and Response are recorded:
+      - 'full': the text itself and its content hash
+      - 'reference': the row number in the input dataset and the content hashes
+      - 'hash': the content hashes only
+    When several datasets were assigned together, the Dataset and Original UID columns record
+    where each blinded UID came from, unless blind is set.
     """
+    if text not in MAPPING_TEXT_MODES:
+        raise ValueError(f"text must be one of {MAPPING_TEXT_MODES}")
+
+    # Every assigned input row and the evaluators it went to. Rows are keyed by their row in
+    # the input, or by identity when they did not come from read_dataset.
     mapping = {}
+    with_dataset = False
     for ev, rows in assignments.items():
         for r in rows:
-            uid = r['UID']
-            if uid not in mapping:
-                mapping[uid] = {
-                    'UID': uid,
-                    'Architecture ID': r['Architecture ID'],
-                    'Batch ID': r['Batch ID'],
-                    'Prompt': r['Prompt'],
-                    'Response': r['Response'],
-                    'Reviewers': []
-                }
-            mapping[uid]['Reviewers'].append(ev)
-  
-    df_map = pd.DataFrame([{
-        'UID': v['UID'],
-        'Architecture ID': v['Architecture ID'],
-        'Batch ID': v['Batch ID'],
-        'Prompt': v['Prompt'],
-        'Response': v['Response'],
-        'Reviewers': ', '.join(map(str, sorted(v['Reviewers'])))
-    } for v in mapping.values()])
+            entry = mapping.setdefault((r['UID'], r.get('Source Row', id(r))), (r, []))
+            entry[1].append(ev)
+            with_dataset = with_dataset or ('Dataset' in r and not blind)
+
+    header = ['Dataset', 'UID', 'Original UID'] if with_dataset else ['UID']
+    header += ['Architecture ID', 'Batch ID']
+    if text == 'full':
+        header += ['Prompt', 'Response']
+    elif text == 'reference':
+        header += ['Source Row']
+    header += ['Prompt Hash', 'Response Hash', 'Reviewers']
+    yield header
+
+    for r, reviewers in mapping.values():
+        row = [r['Dataset'], r['UID'], r['Original UID']] if with_dataset else [r['UID']]
+        row += [r['Architecture ID'], r['Batch ID']]
+        if text == 'full':
+            row += [r['Prompt'], r['Response']]
+        elif text == 'reference':
+            row += [r.get('Source Row')]
+        row += [content_hash(r['Prompt']), content_hash(r['Response']),
+                ', '.join(map(str, sorted(reviewers)))]
+        yield [None if pd.isna(v) else v for v in row]
+
+
+def write_mapping(assignments, target, text : str = 'full', blind : bool = False):
+    """Stream the mapping workbook for assignments to target, a path or a writable file object.
+
+    The workbook is written in write-only mode, so rows go straight to the file without
+    building a dataframe or keeping the sheet in memory."""
+
+    wb = Workbook(write_only=True)
+    bold = Font(bold=True)
+
+    def header_row(ws, values):
+        cells = []
+        for value in values:
+            cell = WriteOnlyCell(ws, value=value)
+            cell.font = bold
+            cells.append(cell)
+        return cells
+
+    # Assignments sheet, headers on row 2
+    ws = wb.create_sheet('Assignments')
+    rows = iter_mapping_rows(assignments, text, blind)
+    ws.append([])
+    ws.append(header_row(ws, next(rows)))
+    for row in rows:
+        ws.append(row)
 
+    # Summary sheet
+    ws = wb.create_sheet('Summary')
+    ws.append(header_row(ws, ['ReviewerID', 'Count']))
+    for ev, ev_rows in assignments.items():
+        ws.append([ev, len(ev_rows)])
+    wb.save(target)
 
+
+def output_mapping_workbook(assignments, output_folder, text : str = 'full'):
+    """
+    Writes assignment_mapping.xlsx with two sheets:
+      - 'Assignments' starting at row 2 (UID, Architecture ID, Batch ID, the Prompt and
+        Response text or row reference, Prompt Hash, Response Hash, Reviewers)
+      - 'Summary' listing ReviewerID and count of assigned prompts.
+    """
     path = os.path.join(output_folder, 'assignment_mapping.xlsx')
-    with pd.ExcelWriter(path, engine='openpyxl') as writer:
-        # Assignments sheet
-        df_map.to_excel(writer, index=False, startrow=1, sheet_name='Assignments', header=True)
-        # write headers manually at row 5, cols B-F
-        wb = writer.book
-        ws = wb['Assignments']
-
-        # Summary sheet
-        summary = pd.DataFrame([{'ReviewerID': ev, 'Count': len(rows)}
-                                 for ev, rows in assignments.items()])
-        summary.to_excel(writer, index=False, startrow=0, sheet_name='Summary')
+    write_mapping(assignments, path, text)
     print(f"Created companion mapping workbook: {path}")
 
 
-def assign_workbooks(input_file, output_folder, num_evaluators, evaluators_per_row : int = 3):
-    
-    if num_evaluators < 3 or num_evaluators > 20:
-        raise SystemExit('num_evaluators must be 3–20')
+def read_dataset(input_file) -> pd.DataFrame:
+    """Load a BBG benchmark dataset and confirm it has every required column."""
+
     df = pd.read_excel(input_file)
-    for c in ['UID', 'Architecture ID','Jailbroken Prompt','Reason 1', 'Reason 2', 'Reason 3', 'Reason 4' ,'Reason 5', 'Category','Element','Task','Batch ID', 'Prompt','Response']:
+    for c in INPUT_COLUMNS:
         if c not in df.columns:
             raise SystemExit(f'Missing column {c}')
+    # Row number in the input workbook, so the mapping can refer back to it
+    df['Source Row'] = df.index + 2
+    return df
+
+
+def dataset_files(input_file) -> list:
+    """Return input_file, a single dataset path or a list of them, as a list of paths."""
+
+    if isinstance(input_file, (str, Path)):
+        return [input_file]
+    return list(input_file)
+
+
+def read_datasets(input_file) -> pd.DataFrame:
+    """Load one or several BBG benchmark datasets into a single dataframe.
+
+    With several datasets, each row is tagged with the name of its file in a Dataset column,
+    so the model behind each row is only recorded in the mapping workbook. The UIDs are
+    blinded later by shuffle_datasets, once the seed of the run is known."""
+
+    files = dataset_files(input_file)
+    if len(files) == 1:
+        return read_dataset(files[0])
+
+    frames = []
+    names = set()
+    for i, f in enumerate(files, start=1):
+        name = Path(f).stem
+        if name in names:
+            name = f"{name} ({i})"
+        names.add(name)
+        frames.append(read_dataset(f).assign(Dataset=name))
+    return pd.concat(frames, ignore_index=True)
+
+
+def blinded_uid(seed, dataset, uid) -> str:
+    """Return the UID shown to evaluators for a row of a multi-dataset campaign.
+
+    It is derived from the run seed, the dataset and the original UID, so the same seed gives
+    the same UIDs on resume, repeats of a UID within a dataset share a blinded UID, and the
+    original UIDs cannot be recovered by hashing known dataset names and UIDs."""
 
-    assignments = assign_rows(df, num_evaluators, evaluators_per_row)
-    output_from_template(assignments, output_folder)
-    output_mapping_workbook(assignments, output_folder)
+    return hashlib.sha256(f"{seed}\x00{dataset}\x00{uid}".encode('utf-8')).hexdigest()[:12].upper()
+
+
+def shuffle_datasets(df : pd.DataFrame, seed : int | None = None) -> pd.DataFrame:
+    """Blind the UIDs of several datasets and interleave their rows in a seeded random order,
+    so no evaluator can tell which model a row came from by its UID or its position.
+
+    Models benchmarked on the same prompts share UIDs, so each UID is replaced by a blinded UID
+    (see blinded_uid) and the original is kept in an Original UID column. Without a seed a
+    random one is used. A single dataset keeps its UIDs and its order."""
+
+    if 'Dataset' not in df.columns:
+        return df
+    if seed is None:
+        seed = random.randrange(2**32)
+
+    df = df.assign(**{'Original UID': df['UID']})
+    df['UID'] = [blinded_uid(seed, d, uid) for d, uid in zip(df['Dataset'], df['Original UID'])]
+    if df.groupby('UID')[['Dataset', 'Original UID']].nunique().gt(1).any(axis=None):
+        raise SystemExit(f'Blinded UIDs collide with seed {seed}, choose another --seed')
+    return df.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+def start_journal(input_files, df, settings, seed):
+    """Assign the rows with the given seed and return the assignments and a new run journal.
+
+    settings holds the arguments of assign_workbooks that change the outputs."""
+
+    assignments = assign_rows(df, settings['num_evaluators'], settings['evaluators_per_row'], seed)
+    journal = {
+        'input_files': [str(f) for f in input_files],
+        'input_sha256': [file_checksum(f) for f in input_files],
+        **settings,
+        'seed': seed,
+        'plan': {str(ev): [str(r['UID']) for r in rows] for ev, rows in assignments.items()},
+        'completed': {},
+        'mapping': None
+    }
+    return assignments, journal
+
+
+def resume_journal(journal, input_files, df, settings):
+    """Rebuild the assignments recorded in the journal of an interrupted run.
+
+    Raises SystemExit if the datasets or the settings no longer match the journal."""
+
+    for key, value in settings.items():
+        if journal.get(key) != value:
+            raise SystemExit(f"Cannot resume: {key} was {journal.get(key)} in the previous run, not {value}")
+    if [file_checksum(f) for f in input_files] != journal.get('input_sha256'):
+        raise SystemExit("Cannot resume: the input datasets have changed since the previous run")
+
+    assignments = assign_rows(df, settings['num_evaluators'], settings['evaluators_per_row'], journal['seed'])
+    plan = {str(ev): [str(r['UID']) for r in rows] for ev, rows in assignments.items()}
+    if plan != journal['plan']:
+        raise SystemExit("Cannot resume: the assignment plan could not be reproduced")
+    return assignments
+
+
+def assign_workbooks(input_file, output_folder, num_evaluators, evaluators_per_row : int = 3, dry_run : bool = False,
+                     archive : str | None = None, include_mapping : bool = False,
+                     resume : bool = False, seed : int | None = None, mapping_text : str = 'full'):
+    """Assign the dataset rows to evaluators and generate their workbooks and the mapping workbook.
+
+    input_file is a BBG dataset or a list of them. Several datasets (e.g. one per benchmarked
+    model) are shuffled together and assigned in a single pass, so every evaluator gets one
+    workbook. Which dataset each row came from is only recorded in assignment_mapping.xlsx.
+
+    With dry_run the plan is computed and returned as a dataframe, but the template is not
+    read and nothing is written to output_folder. If the plan is not feasible, the dry run
+    reports and returns the list of issues instead. archive and include_mapping select the
+    distribution layout, see output_from_template. mapping_text selects whether the mapping
+    workbooks carry the Prompt and Response text, a row reference or only content hashes.
+
+    Every run keeps a journal in output_folder with the seeded assignment plan and the
+    checksum of every finished output. With resume, the plan of the previous run is reused
+    and only missing or corrupt outputs are generated again."""
+    input_files = dataset_files(input_file)
+    journal = load_journal(output_folder) if resume and not dry_run else None
+    if journal is not None:
+        seed = journal['seed']
+    elif seed is None:
+        seed = random.randrange(2**32)
+    # Blind the UIDs before checking feasibility, models share UIDs but not blinded UIDs
+    df = shuffle_datasets(read_datasets(input_files), seed)
+
+    issues = check_feasibility(df, num_evaluators, evaluators_per_row)
+    if issues and dry_run:
+        print("The assignment plan is not feasible:")
+        print(summarise_issues(issues))
+        return issues
+    if issues:
+        raise SystemExit(summarise_issues(issues))
+
+    print(f"Evaluators: {num_evaluators}")
+    print(f"reviewers per row: {evaluators_per_row}")
+    if dry_run:
+        _, plan = plan_assignments(df, num_evaluators, evaluators_per_row, seed)
+        print(plan.to_string(index=False))
+        print(f"Total estimated size: {plan['Estimated Bytes'].sum()} bytes, "
+              f"time: {plan['Estimated Seconds'].sum():.1f} s")
+        return plan
+
+    settings = {
+        'num_evaluators': num_evaluators,
+        'evaluators_per_row': evaluators_per_row,
+        'archive': archive,
+        'include_mapping': include_mapping,
+        'mapping_text': mapping_text
+    }
+    os.makedirs(output_folder, exist_ok=True)
+    if journal is not None:
+        assignments = resume_journal(journal, input_files, df, settings)
+        print(f"Resuming previous run, {len(journal['completed'])} of {num_evaluators} evaluators already done.")
+    else:
+        assignments, journal = start_journal(input_files, df, settings, seed)
+        save_journal(journal, output_folder)
+
+    output_from_template(assignments, output_folder, archive, include_mapping, journal, mapping_text)
+
+    mapping = journal['mapping']
+    if mapping is None or not verify_files(output_folder, mapping):
+        output_mapping_workbook(assignments, output_folder, mapping_text)
+        journal['mapping'] = {'assignment_mapping.xlsx': file_checksum(os.path.join(output_folder, 'assignment_mapping.xlsx'))}
+        save_journal(journal, output_folder)
     print('Done.')
+
+
+def main() -> int:
+    """Command line entry point. Returns 1 if a dry run finds an infeasible plan, otherwise 0."""
+
+    parser = argparse.ArgumentParser(description="Generate evaluator workbooks from a BBG benchmark dataset.")
+    parser.add_argument("input_files", nargs="+",
+                        help="Completed BBG benchmark dataset(s) (.xlsx), several are assigned together")
+    parser.add_argument("-o", "--output-folder", default=".", help="Folder to write the workbooks to")
+    parser.add_argument("-n", "--num-evaluators", type=int, nargs="+", default=[3],
+                        help="Number of evaluators (several values may be given with --dry-run)")
+    parser.add_argument("-k", "--evaluators-per-row", type=int, nargs="+", default=[3],
+                        help="Evaluations per prompt-response pair (several values may be given with --dry-run)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Only report the assignment plan, do not read the template or write files. "
+                             "Exits with status 1 if any requested plan is not feasible")
+    parser.add_argument("--zip", choices=["per-evaluator", "combined"], default=None,
+                        help="Stream the evaluator workbooks into zip archives instead of folders")
+    parser.add_argument("--evaluator-mapping", action="store_true",
+                        help="Give each evaluator their slice of assignment_mapping.xlsx")
+    parser.add_argument("--mapping-text", choices=MAPPING_TEXT_MODES, default="full",
+                        help="Record Prompt and Response in the mapping as full text, an input row reference or hashes only")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue an interrupted run in output_folder, keeping finished workbooks")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for the random assignment")
+    args = parser.parse_args()
+
+    if args.dry_run and (len(args.num_evaluators) > 1 or len(args.evaluators_per_row) > 1):
+        sweep = sweep_plans(args.input_files, args.num_evaluators, args.evaluators_per_row)
+        print(sweep.to_string(index=False))
+        return 0 if sweep['Feasible'].all() else 1
+    if len(args.num_evaluators) > 1 or len(args.evaluators_per_row) > 1:
+        parser.error("multiple values are only supported with --dry-run")
+    result = assign_workbooks(args.input_files, args.output_folder, args.num_evaluators[0],
+                     args.evaluators_per_row[0], dry_run=args.dry_run,
+                     archive=args.zip.replace('-', '_') if args.zip else None,
+                     include_mapping=args.evaluator_mapping,
+                     resume=args.resume, seed=args.seed, mapping_text=args.mapping_text)
+    # A dry run returns the list of issues when the plan is not feasible
+    return 1 if isinstance(result, list) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -114,12 +114,12 @@ class EvaluatorApp(ttk.Frame):
     # Dialog helpers
     # ------------------------------------------------------------------
     def _browse_input(self):
-        filename = filedialog.askopenfilename(
-            title="Select input Excel file",
+        filenames = filedialog.askopenfilenames(
+            title="Select input Excel file(s)",
             filetypes=[("Excel files", "*.xlsx *.xls")],
         )
-        if filename:
-            self.input_path.set(filename)
+        if filenames:
+            self.input_path.set("; ".join(filenames))
 
     def _browse_output(self):
         folder = filedialog.askdirectory(title="Select output folder")
@@ -132,7 +132,8 @@ class EvaluatorApp(ttk.Frame):
     def _run(self):
         self.status_text.set("Running...")
         self.update()
-        input_file = self.input_path.get().strip()
+        # Several datasets are separated by semicolons and assigned together
+        input_files = [f.strip() for f in self.input_path.get().split(";") if f.strip()]
         output_folder = self.output_path.get().strip()
 
         try:
@@ -147,7 +148,7 @@ class EvaluatorApp(ttk.Frame):
             eval_per_row = 3
 
         # Basic validation so the user gets instant feedback
-        if not input_file:
+        if not input_files:
             messagebox.showerror("Error", "Please choose an input Excel file.")
             return
         if not output_folder:
@@ -165,7 +166,7 @@ class EvaluatorApp(ttk.Frame):
         Path(output_folder).mkdir(parents=True, exist_ok=True)
 
         try:
-            assign_workbooks(input_file, output_folder, num_eval)
+            assign_workbooks(input_files, output_folder, num_eval)
         except SystemExit as exc:  # validation errors surfaced by backend
             print(logging.error(exc, exc_info=True))
             messagebox.showerror("Validation Error", str(exc))
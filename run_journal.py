@@ -0,0 +1,123 @@
+import os
+import json
+import hashlib
+import struct
+import zipfile
+
+
+# Journal file written next to the generated workbooks
+JOURNAL_NAME = 'run_journal.json'
+
+
+def file_checksum(path) -> str:
+    """Return the sha256 hex digest of the file at path."""
+
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def journal_path(output_folder) -> str:
+    return os.path.join(output_folder, JOURNAL_NAME)
+
+
+def load_journal(output_folder) -> dict | None:
+    """Return the journal of a previous run in output_folder, or None if there is none."""
+
+    path = journal_path(output_folder)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_journal(journal, output_folder):
+    """Write the journal atomically so a crash never leaves it half written."""
+
+    path = journal_path(output_folder)
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(journal, f, indent=2)
+    os.replace(tmp, path)
+
+
+def verify_files(output_folder, checksums) -> bool:
+    """Confirm that every file in checksums (relative path -> sha256) exists and is unchanged."""
+
+    for name, expected in checksums.items():
+        path = os.path.join(output_folder, name)
+        if not os.path.isfile(path) or file_checksum(path) != expected:
+            return False
+    return True
+
+
+def recover_archive(path, completed) -> set:
+    """Rebuild the central directory of a ZIP_STORED archive, keeping only finished members.
+
+    Appending to a zip overwrites its central directory, so a crash or a full disk part way
+    through leaves a damaged archive, although the members written before the append are
+    intact. The local headers are scanned from the start of the file and every
+    member is checked against its sha256 in completed (evaluator -> {member name -> sha256}).
+    The leading run of members that make up whole finished evaluators is kept, the rest of
+    the file is cut off and a new central directory is written after it.
+    Returns the evaluators whose members were kept."""
+
+    expected = {name: (ev, digest) for ev, done in completed.items() for name, digest in done.items()}
+    infos = []
+    found = {}
+    kept = set()
+    keep_count = 0
+    end = 0
+
+    with open(path, 'r+b') as fp:
+        offset = 0
+        while True:
+            fp.seek(offset)
+            header = fp.read(zipfile.sizeFileHeader)
+            if len(header) < zipfile.sizeFileHeader or header[:4] != zipfile.stringFileHeader:
+                break
+            (_, _, _, flags, method, time, date, crc,
+             compress_size, file_size, name_len, extra_len) = struct.unpack(zipfile.structFileHeader, header)
+            # Only stored members with their sizes in the local header can be recovered
+            if method != zipfile.ZIP_STORED or flags & 0x08 or compress_size == 0xffffffff:
+                break
+            name = fp.read(name_len).decode('utf-8' if flags & 0x800 else 'cp437')
+            extra = fp.read(extra_len)
+            data = fp.read(compress_size)
+            if len(data) < compress_size or name not in expected:
+                break
+            ev, digest = expected[name]
+            if hashlib.sha256(data).hexdigest() != digest:
+                break
+
+            info = zipfile.ZipInfo(name, date_time=(
+                (date >> 9) + 1980, (date >> 5) & 0xF, date & 0x1F,
+                time >> 11, (time >> 5) & 0x3F, (time & 0x1F) * 2
+            ))
+            info.compress_type = zipfile.ZIP_STORED
+            info.flag_bits = flags
+            info.CRC = crc
+            info.compress_size = compress_size
+            info.file_size = file_size
+            info.header_offset = offset
+            info.extra = extra
+            info.external_attr = 0o600 << 16
+            infos.append(info)
+
+            offset = fp.tell()
+            found.setdefault(ev, set()).add(name)
+            if found[ev] == set(completed[ev]):
+                kept.add(ev)
+                keep_count = len(infos)
+                end = offset
+
+        fp.seek(end)
+        fp.truncate()
+        zf = zipfile.ZipFile(fp, 'w', zipfile.ZIP_STORED)
+        for info in infos[:keep_count]:
+            zf.filelist.append(info)
+            zf.NameToInfo[info.filename] = info
+        zf.close()
+    return kept